@@ -45,6 +45,11 @@ SESSION_EXPIRATION_TIME = 3600
 LOGDIR = os.getenv("LOGDIR", ".")
 # CPU Instruction Set Architecture
 CPU_ISA = os.getenv("CPU_ISA")
+# How long the web server reuses a worker address from the controller (0 disables caching).
+# While cached, all chats with a model go to one worker instead of the controller's pick.
+WORKER_ADDRESS_CACHE_TTL = float(os.getenv("FASTCHAT_WORKER_ADDRESS_CACHE_TTL", 0))
+# Minimum seconds between two streamed chatbot updates sent to the browser
+STREAM_YIELD_INTERVAL = float(os.getenv("FASTCHAT_STREAM_YIELD_INTERVAL", 0.05))
 
 
 ##### For the controller and workers (could be overwritten through ENV variables.)
@@ -1,5 +1,11 @@
-from fastchat.model.model_adapter import (
-    load_model,
-    get_conversation_template,
-    add_model_args,
-)
+# model_adapter imports torch and transformers, so it is only loaded when one of
+# its helpers is accessed. This keeps e.g. fastchat.model.model_registry light.
+_model_adapter_exports = ("load_model", "get_conversation_template", "add_model_args")
+
+
+def __getattr__(name):
+    if name in _model_adapter_exports:
+        from fastchat.model import model_adapter
+
+        return getattr(model_adapter, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,5 +1,6 @@
 """Additional information of the models."""
 from collections import namedtuple, OrderedDict
+from functools import lru_cache
 from typing import List
 
 
@@ -16,8 +17,11 @@ def register_model_info(
 
     for full_name in full_names:
         model_info[full_name] = info
+    # Drop cached fallbacks for names that are registered late
+    get_model_info.cache_clear()
 
 
+@lru_cache(maxsize=1024)
 def get_model_info(name: str) -> ModelInfo:
     if name in model_info:
         return model_info[name]
@@ -3,22 +3,37 @@ The gradio demo server for chatting with a single model.
 """
 
 import argparse
-from collections import defaultdict
+import atexit
+from collections import OrderedDict
 import datetime
+import functools
 import hashlib
+import html
+import importlib
 import json
 import os
-import random
+import queue
+import re
+import secrets
+import threading
 import time
-import uuid
-from typing import List, Dict
+from pathlib import Path
+from typing import Dict
 
 import gradio as gr
 import requests
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
 from fastchat.constants import (
     LOGDIR,
     WORKER_API_TIMEOUT,
+    WORKER_ADDRESS_CACHE_TTL,
     ErrorCode,
     MODERATION_MSG,
     CONVERSATION_LIMIT_MSG,
@@ -26,12 +41,9 @@ from fastchat.constants import (
     SERVER_ERROR_MSG,
     INPUT_CHAR_LEN_LIMIT,
     CONVERSATION_TURN_LIMIT,
-    SESSION_EXPIRATION_TIME,
+    STREAM_YIELD_INTERVAL,
     SURVEY_LINK,
 )
-from fastchat.model.model_adapter import (
-    get_conversation_template,
-)
 from fastchat.model.model_registry import get_model_info, model_info
 from fastchat.serve.api_provider import get_api_provider_stream_iter
 from fastchat.serve.gradio_global_state import Context
@@ -42,13 +54,25 @@ from fastchat.utils import (
     get_window_url_params_with_tos_js,
     moderation_filter,
     parse_gradio_auth_creds,
-    load_image,
 )
 
 logger = build_logger("gradio_web_server", "gradio_web_server.log")
 
 headers = {"User-Agent": "FastChat Client"}
 
+# A shared session so that calls to the controller, workers and monitor reuse
+# keep-alive connections instead of opening a new one per request.
+# Only connection errors are retried; a request that reached the server is never resent.
+http_session = requests.Session()
+http_session.headers.update(headers)
+_http_adapter = HTTPAdapter(
+    pool_connections=64,
+    pool_maxsize=256,
+    max_retries=Retry(total=3, connect=3, read=0, backoff_factor=0.1),
+)
+http_session.mount("http://", _http_adapter)
+http_session.mount("https://", _http_adapter)
+
 no_change_btn = gr.Button()
 enable_btn = gr.Button(interactive=True, visible=True)
 disable_btn = gr.Button(interactive=False)
@@ -64,6 +88,14 @@ disable_text = gr.Textbox(
     placeholder='Kliki "🎲 Uus vestlus" et uut vestlust alustada.',
 )
 
+# Updates for the five buttons below the chatbot (upvote, downvote, flag, regenerate, clear)
+no_change_btns = (no_change_btn,) * 5
+enable_btns = (enable_btn,) * 5
+disable_btns = (disable_btn,) * 5
+# After an error only regenerate and clear stay usable
+error_btns = (disable_btn,) * 3 + (enable_btn,) * 2
+
+
 controller_url = None
 enable_moderation = False
 use_remote_storage = False
@@ -91,11 +123,27 @@ Palun ära siseseta platvormile isiklikku informatsiooni. Platvorm kogub kasutaj
 
 api_endpoint_info = {}
 
+# Static assets (stylesheets) shipped next to this module
+static_dir = Path(__file__).parent / "static"
+
+
+# Placeholders in system prompts, e.g. {{currentDateTime}}, {{currentDateTimev2}}
+current_date_pattern = re.compile(r"\{\{currentDateTime(v2|v3)?\}\}")
+current_date_formats = {None: "%Y-%m-%d", "v2": "%d %b %Y", "v3": "%B %Y"}
+
+
+@functools.lru_cache(maxsize=16)
+def format_current_date(date, version):
+    return date.strftime(current_date_formats[version])
+
 
 class State:
     def __init__(self, model_name, is_vision=False):
+        # model_adapter pulls in torch and transformers; __main__ loads it at startup
+        from fastchat.model.model_adapter import get_conversation_template
+
         self.conv = get_conversation_template(model_name)
-        self.conv_id = uuid.uuid4().hex
+        self.conv_id = secrets.token_hex(16)
         self.skip_next = False
         self.model_name = model_name
         self.oai_thread_id = None
@@ -111,6 +159,13 @@ class State:
             self.regen_support = False
         self.init_system_prompt(self.conv, is_vision)
 
+        # Snapshot of self.conv.dict() and the conversation content it was built from
+        self._conv_dict = None
+        self._conv_dict_key = None
+        # Last result of to_gradio_chatbot() and the earlier messages it was built from
+        self._chatbot = None
+        self._chatbot_key = None
+
     def update_ans_models(self, ans: str) -> None:
         self.ans_models.append(ans)
 
@@ -121,21 +176,53 @@ class State:
         system_prompt = conv.get_system_message(is_vision)
         if len(system_prompt) == 0:
             return
-        current_date = datetime.datetime.now().strftime("%Y-%m-%d")
-        system_prompt = system_prompt.replace("{{currentDateTime}}", current_date)
-
-        current_date_v2 = datetime.datetime.now().strftime("%d %b %Y")
-        system_prompt = system_prompt.replace("{{currentDateTimev2}}", current_date_v2)
-
-        current_date_v3 = datetime.datetime.now().strftime("%B %Y")
-        system_prompt = system_prompt.replace("{{currentDateTimev3}}", current_date_v3)
+        if "{{currentDateTime" in system_prompt:
+            today = datetime.date.today()
+            system_prompt = current_date_pattern.sub(
+                lambda m: format_current_date(today, m.group(1)), system_prompt
+            )
         conv.set_system_message(system_prompt)
 
     def to_gradio_chatbot(self):
-        return self.conv.to_gradio_chatbot()
+        """Return self.conv.to_gradio_chatbot().
+
+        While a response is streamed only the last message changes, so when all earlier
+        messages are the same as in the previous call, their rows are reused and only
+        the last row is replaced.
+        """
+        conv = self.conv
+        messages = conv.messages
+        key = (conv.offset, [msg for _, msg in messages[:-1]])
+        num_messages = len(messages) - conv.offset
+        if (
+            self._chatbot
+            and num_messages > 0
+            and num_messages % 2 == 0
+            and key == self._chatbot_key
+        ):
+            chatbot = self._chatbot[:-1]
+            chatbot.append([self._chatbot[-1][0], messages[-1][1]])
+        else:
+            chatbot = conv.to_gradio_chatbot()
+        self._chatbot = chatbot
+        self._chatbot_key = key
+        return chatbot
+
+    def conv_dict(self):
+        """Return self.conv.dict(), rebuilt only when the conversation has changed.
+
+        Building it hashes every uploaded image, and the same unchanged conversation
+        is logged once per vote.
+        """
+        conv = self.conv
+        key = (conv.system_message, conv.offset, [msg for _, msg in conv.messages])
+        if self._conv_dict is None or key != self._conv_dict_key:
+            self._conv_dict = conv.dict()
+            self._conv_dict_key = key
+        return self._conv_dict
 
     def dict(self):
-        base = self.conv.dict()
+        base = dict(self.conv_dict())
         base.update(
             {
                 "conv_id": self.conv_id,
@@ -162,6 +249,10 @@ class State:
         return base
 
 
+def flush_conv_logs():
+    get_conv_log_writer().flush()
+
+
 def set_global_vars(
     controller_url_,
     enable_moderation_,
@@ -173,17 +264,124 @@ def set_global_vars(
     use_remote_storage = use_remote_storage_
 
 
+def json_loads(data):
+    """Parse a JSON document given as str, bytes or bytearray."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+_conv_log_date = None
+_conv_log_filenames = {}
+
+
 def get_conv_log_filename(is_vision=False, has_csam_image=False):
-    t = datetime.datetime.now()
-    conv_log_filename = f"{t.year}-{t.month:02d}-{t.day:02d}-conv.json"
-    if is_vision and not has_csam_image:
-        name = os.path.join(LOGDIR, f"vision-tmp-{conv_log_filename}")
-    elif is_vision and has_csam_image:
-        name = os.path.join(LOGDIR, f"vision-csam-{conv_log_filename}")
-    else:
-        name = os.path.join(LOGDIR, conv_log_filename)
+    global _conv_log_date, _conv_log_filenames
+
+    # The file names only change at midnight, so build them once per day.
+    today = time.strftime("%Y-%m-%d")
+    if today != _conv_log_date:
+        conv_log_filename = f"{today}-conv.json"
+        _conv_log_filenames = {
+            (False, False): os.path.join(LOGDIR, conv_log_filename),
+            (False, True): os.path.join(LOGDIR, conv_log_filename),
+            (True, False): os.path.join(LOGDIR, f"vision-tmp-{conv_log_filename}"),
+            (True, True): os.path.join(LOGDIR, f"vision-csam-{conv_log_filename}"),
+        }
+        _conv_log_date = today
+
+    return _conv_log_filenames[bool(is_vision), bool(has_csam_image)]
+
+
+class ConvLogWriter:
+    """Append JSON lines to the conversation log files.
+
+    Lines are buffered in memory and written out by a background thread once
+    every `flush_interval` seconds, or right away once `max_pending_bytes` are
+    pending. File handles are kept open and rotated when the date changes.
+    """
+
+    def __init__(self, flush_interval=1.0, max_pending_bytes=32 * 1024):
+        self.flush_interval = flush_interval
+        self.max_pending_bytes = max_pending_bytes
+
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.pending_bytes = 0
+        self.files = {}
+        self.files_date = None
+
+        self.thread = threading.Thread(target=self._flush_periodically, daemon=True)
+        self.thread.start()
+
+    def write(self, filename: str, line: str):
+        with self.lock:
+            self.pending.setdefault(filename, []).append(line)
+            self.pending_bytes += len(line)
+            if self.pending_bytes >= self.max_pending_bytes:
+                self._flush()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def close(self):
+        with self.lock:
+            self._flush()
+            self._close_files()
+
+    def _flush(self):
+        today = time.strftime("%Y-%m-%d")
+        if today != self.files_date:
+            self._close_files()
+            self.files_date = today
 
-    return name
+        pending, self.pending, self.pending_bytes = self.pending, {}, 0
+        for filename, lines in pending.items():
+            fout = self.files.get(filename)
+            if fout is None:
+                fout = open(filename, "a", buffering=64 * 1024, encoding="utf-8")
+                self.files[filename] = fout
+            fout.write("".join(lines))
+            fout.flush()
+
+    def _close_files(self):
+        for fout in self.files.values():
+            fout.close()
+        self.files = {}
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Failed to write conversation logs")
+
+
+_conv_log_writer = None
+_conv_log_writer_lock = threading.Lock()
+
+
+def get_conv_log_writer():
+    global _conv_log_writer
+    if _conv_log_writer is None:
+        with _conv_log_writer_lock:
+            if _conv_log_writer is None:
+                _conv_log_writer = ConvLogWriter()
+                atexit.register(_conv_log_writer.close)
+    return _conv_log_writer
+
+
+_model_priority = None
+
+
+def get_model_priority():
+    """Sort keys that list registered models in their registration order."""
+    global _model_priority
+    if _model_priority is None:
+        _model_priority = {k: f"___{i:03d}" for i, k in enumerate(model_info)}
+    return _model_priority
 
 
 def get_model_list(controller_url, register_api_endpoint_file, vision_arena):
@@ -191,14 +389,14 @@ def get_model_list(controller_url, register_api_endpoint_file, vision_arena):
 
     # Add models from the controller
     if controller_url:
-        ret = requests.post(controller_url + "/refresh_all_workers")
+        ret = http_session.post(controller_url + "/refresh_all_workers")
         assert ret.status_code == 200
 
         if vision_arena:
-            ret = requests.post(controller_url + "/list_multimodal_models")
+            ret = http_session.post(controller_url + "/list_multimodal_models")
             models = ret.json()["models"]
         else:
-            ret = requests.post(controller_url + "/list_language_models")
+            ret = http_session.post(controller_url + "/list_language_models")
             models = ret.json()["models"]
     else:
         models = []
@@ -214,22 +412,17 @@ def get_model_list(controller_url, register_api_endpoint_file, vision_arena):
             if not vision_arena and mdl_text:
                 models.append(mdl)
 
-    # Remove anonymous models
-    models = list(set(models))
-    visible_models = models.copy()
-    for mdl in models:
-        if mdl not in api_endpoint_info:
-            continue
-        mdl_dict = api_endpoint_info[mdl]
-        if mdl_dict["anony_only"]:
-            visible_models.remove(mdl)
-
     # Sort models and add descriptions
-    priority = {k: f"___{i:03d}" for i, k in enumerate(model_info)}
-    models.sort(key=lambda x: priority.get(x, x))
-    visible_models.sort(key=lambda x: priority.get(x, x))
-    logger.info(f"All models: {models}")
-    logger.info(f"Visible models: {visible_models}")
+    priority = get_model_priority()
+    models = sorted(dict.fromkeys(models), key=lambda x: priority.get(x, x))
+
+    # Remove anonymous models
+    anony_only = {
+        mdl for mdl, mdl_dict in api_endpoint_info.items() if mdl_dict.get("anony_only")
+    }
+    visible_models = [mdl for mdl in models if mdl not in anony_only]
+    logger.info("All models: %s", models)
+    logger.info("Visible models: %s", visible_models)
     return visible_models, models
 
 
@@ -256,7 +449,7 @@ def load_demo(url_params, request: gr.Request):
     global models
 
     ip = get_ip(request)
-    logger.info(f"load_demo. ip: {ip}. params: {url_params}")
+    logger.info("load_demo. ip: %s. params: %s", ip, url_params)
 
     if args.model_list_mode == "reload":
         models, all_models = get_model_list(
@@ -267,103 +460,157 @@ def load_demo(url_params, request: gr.Request):
 
 
 def vote_last_response(state, vote_type, model_selector, request: gr.Request):
-    filename = get_conv_log_filename()
-    if "llava" in model_selector:
-        filename = filename.replace("2024", "vision-tmp-2024")
-
-    with open(filename, "a") as fout:
-        data = {
-            "tstamp": round(time.time(), 4),
-            "type": vote_type,
-            "model": model_selector,
-            "state": state.dict(),
-            "ip": get_ip(request),
-        }
-        fout.write(json.dumps(data) + "\n")
+    filename = get_conv_log_filename(
+        is_vision=state.is_vision or "llava" in model_selector,
+        has_csam_image=state.has_csam_image,
+    )
+
+    data = {
+        "tstamp": round(time.time(), 4),
+        "type": vote_type,
+        "model": model_selector,
+        "state": state.dict(),
+        "ip": get_ip(request),
+    }
+    get_conv_log_writer().write(filename, json.dumps(data) + "\n")
     get_remote_logger().log(data)
 
 
 def upvote_last_response(state, model_selector, request: gr.Request):
     ip = get_ip(request)
-    logger.info(f"upvote. ip: {ip}")
+    logger.info("upvote. ip: %s", ip)
     vote_last_response(state, "upvote", model_selector, request)
     return ("",) + (disable_btn,) * 3
 
 
 def downvote_last_response(state, model_selector, request: gr.Request):
     ip = get_ip(request)
-    logger.info(f"downvote. ip: {ip}")
+    logger.info("downvote. ip: %s", ip)
     vote_last_response(state, "downvote", model_selector, request)
     return ("",) + (disable_btn,) * 3
 
 
 def flag_last_response(state, model_selector, request: gr.Request):
     ip = get_ip(request)
-    logger.info(f"flag. ip: {ip}")
+    logger.info("flag. ip: %s", ip)
     vote_last_response(state, "flag", model_selector, request)
     return ("",) + (disable_btn,) * 3
 
 
 def regenerate(state, request: gr.Request):
     ip = get_ip(request)
-    logger.info(f"regenerate. ip: {ip}")
+    logger.info("regenerate. ip: %s", ip)
     if not state.regen_support:
         state.skip_next = True
-        return (state, state.to_gradio_chatbot(), "", None) + (no_change_btn,) * 5
+        return (state, state.to_gradio_chatbot(), "", None) + no_change_btns
     state.conv.update_last_message(None)
-    return (state, state.to_gradio_chatbot(), "") + (disable_btn,) * 5
+    return (state, state.to_gradio_chatbot(), "") + disable_btns
 
 
 def clear_history(request: gr.Request):
     ip = get_ip(request)
-    logger.info(f"clear_history. ip: {ip}")
+    logger.info("clear_history. ip: %s", ip)
     state = None
-    return (state, [], "") + (disable_btn,) * 5
+    return (state, [], "") + disable_btns
+
+
+# Headers carrying the client address when running behind a proxy, in order of preference
+ip_headers = ("cf-connecting-ip", "x-forwarded-for")
 
 
 def get_ip(request: gr.Request):
-    if "cf-connecting-ip" in request.headers:
-        ip = request.headers["cf-connecting-ip"]
-    elif "x-forwarded-for" in request.headers:
-        ip = request.headers["x-forwarded-for"]
-        if "," in ip:
-            ip = ip.split(",")[0]
-    else:
-        ip = request.client.host
-    return ip
+    request_headers = request.headers
+    for name in ip_headers:
+        ip = request_headers.get(name)
+        if ip is not None:
+            # x-forwarded-for may hold a chain of proxies; the client comes first
+            return ip.partition(",")[0]
+    return request.client.host
+
+
+def get_recent_conv_text(conv, max_len):
+    """Return the last `max_len` characters of the conversation as "role: message" lines.
+
+    Only the trailing messages needed to fill `max_len` are visited, so the cost does
+    not grow with the length of the conversation.
+    """
+    parts = []
+    total_len = 0
+    for role, message in reversed(conv.messages):
+        if not message:
+            continue
+        if type(message) is tuple:
+            message = message[0]
+        parts.append(f"{role}: {message}")
+        total_len += len(parts[-1]) + 1
+        if total_len >= max_len:
+            break
+    return "\n".join(reversed(parts))[-max_len:]
+
+
+moderation_cache = OrderedDict()
+moderation_cache_lock = threading.Lock()
+moderation_cache_size = 4096
+
+
+def cached_moderation_filter(text, model_name):
+    """Memoized moderation_filter() so that resubmitting the same text does not call
+    the moderation API again. Entries are keyed by a digest of the text.
+
+    Only passing verdicts are cached: oai_moderation() also reports flagged=True
+    when the API call fails, and that must not outlive the outage."""
+    key = (hashlib.blake2b(text.encode(), digest_size=16).digest(), model_name)
+    with moderation_cache_lock:
+        if key in moderation_cache:
+            moderation_cache.move_to_end(key)
+            return moderation_cache[key]
+
+    flagged = moderation_filter(text, [model_name])
+    if not flagged:
+        with moderation_cache_lock:
+            moderation_cache[key] = flagged
+            if len(moderation_cache) > moderation_cache_size:
+                moderation_cache.popitem(last=False)
+    return flagged
 
 
 def add_text(state, model_selector, text, request: gr.Request):
     ip = get_ip(request)
-    logger.info(f"add_text. ip: {ip}. len: {len(text)}")
+    logger.info("add_text. ip: %s. len: %d", ip, len(text))
 
     if state is None:
         state = State(model_selector)
 
     if len(text) <= 0:
         state.skip_next = True
-        return (state, state.to_gradio_chatbot(), "", None) + (no_change_btn,) * 5
+        return (state, state.to_gradio_chatbot(), "", None) + no_change_btns
 
-    all_conv_text = state.conv.get_prompt()
-    all_conv_text = all_conv_text[-2000:] + "\nuser: " + text
-    flagged = moderation_filter(all_conv_text, [state.model_name])
+    if len(text.strip()) < 3:
+        # Too short to violate anything; the earlier turns were already checked
+        flagged = False
+    else:
+        all_conv_text = get_recent_conv_text(state.conv, 2000) + "\nuser: " + text
+        flagged = cached_moderation_filter(all_conv_text, state.model_name)
     # flagged = moderation_filter(text, [state.model_name])
     if flagged:
-        logger.info(f"violate moderation. ip: {ip}. text: {text}")
+        logger.info("violate moderation. ip: %s. text: %s", ip, text)
         # overwrite the original text
         text = MODERATION_MSG
 
     if (len(state.conv.messages) - state.conv.offset) // 2 >= CONVERSATION_TURN_LIMIT:
-        logger.info(f"conversation turn limit. ip: {ip}. text: {text}")
+        logger.info("conversation turn limit. ip: %s. text: %s", ip, text)
         state.skip_next = True
-        return (state, state.to_gradio_chatbot(), CONVERSATION_LIMIT_MSG, None) + (
-            no_change_btn,
-        ) * 5
+        return (
+            state,
+            state.to_gradio_chatbot(),
+            CONVERSATION_LIMIT_MSG,
+            None,
+        ) + no_change_btns
 
     text = text[:INPUT_CHAR_LEN_LIMIT]  # Hard cut-off
     state.conv.append_message(state.conv.roles[0], text)
     state.conv.append_message(state.conv.roles[1], None)
-    return (state, state.to_gradio_chatbot(), "") + (disable_btn,) * 5
+    return (state, state.to_gradio_chatbot(), "") + disable_btns
 
 
 def model_worker_stream_iter(
@@ -390,36 +637,229 @@ def model_worker_stream_iter(
         "echo": False,
     }
 
-    logger.info(f"==== request ====\n{gen_params}")
+    logger.info("==== request ====\n%s", gen_params)
 
     if len(images) > 0:
         gen_params["images"] = images
 
     # Stream output
-    response = requests.post(
+    response = http_session.post(
         worker_addr + "/worker_generate_stream",
-        headers=headers,
         json=gen_params,
         stream=True,
         timeout=WORKER_API_TIMEOUT,
     )
-    for chunk in response.iter_lines(decode_unicode=False, delimiter=b"\0"):
-        if chunk:
-            data = json.loads(chunk.decode())
-            yield data
+    # The worker separates JSON messages with b"\0". Split them out of the raw
+    # stream directly; iter_lines() with a custom delimiter is much slower.
+    buffer = bytearray()
+    for content in response.iter_content(chunk_size=8192):
+        buffer += content
+        start = 0
+        while (end := buffer.find(b"\0", start)) != -1:
+            if end > start:
+                yield json_loads(buffer[start:end])
+            start = end + 1
+        del buffer[:start]
+    if buffer:
+        yield json_loads(buffer)
+
+
+worker_addr_cache = {}
+worker_addr_cache_lock = threading.Lock()
+# One lock per model, held across a cache miss so concurrent misses share one lookup
+worker_addr_miss_locks = {}
+
+
+def get_worker_address(model_name, ttl=WORKER_ADDRESS_CACHE_TTL):
+    """Ask the controller for a worker serving `model_name`.
+
+    With `ttl` > 0, answers are reused for `ttl` seconds so that concurrent chats with
+    the same model share one lookup. The controller then no longer balances those chats
+    across the model's workers, so this is off by default. An empty answer (no worker
+    available) is only kept for a second so that a newly registered worker is picked up
+    quickly.
+    """
+    if ttl <= 0:
+        ret = http_session.post(
+            controller_url + "/get_worker_address", json={"model": model_name}
+        )
+        return ret.json()["address"]
+
+    with worker_addr_cache_lock:
+        cached = worker_addr_cache.get(model_name)
+        miss_lock = worker_addr_miss_locks.setdefault(model_name, threading.Lock())
+    if cached is not None and cached[0] > time.time():
+        return cached[1]
+
+    with miss_lock:
+        # Another thread may have filled the entry while this one waited
+        with worker_addr_cache_lock:
+            cached = worker_addr_cache.get(model_name)
+        now = time.time()
+        if cached is not None and cached[0] > now:
+            return cached[1]
+
+        ret = http_session.post(
+            controller_url + "/get_worker_address", json={"model": model_name}
+        )
+        worker_addr = ret.json()["address"]
+        expire = now + (ttl if worker_addr else min(ttl, 1.0))
+        with worker_addr_cache_lock:
+            worker_addr_cache[model_name] = (expire, worker_addr)
+    return worker_addr
+
+
+class RateLimitCache:
+    """Answers of the monitor's /is_limit_reached endpoint, refreshed in the background.
+
+    The monitor only recomputes its call statistics every few minutes, so an answer
+    that is `max_age` seconds old is as good as a fresh one. Lookups never wait for
+    the network: a missing or stale entry is queued for background threads, and the
+    last known answer (None if there is none yet) is returned meanwhile.
+    """
+
+    def __init__(self, url: str, max_age=30.0, max_entries=100000, num_threads=4):
+        self.url = url
+        self.max_age = max_age
+        self.max_entries = max_entries
+
+        # Not http_session: retrying an absent monitor would only delay the queue
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=num_threads, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.lock = threading.Lock()
+        self.results = {}
+        self.pending = set()
+        self.queue = queue.Queue()
+        self.threads = [
+            threading.Thread(target=self._refresh_results, daemon=True)
+            for _ in range(num_threads)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def get(self, model_name: str, ip: str):
+        key = (model_name, ip)
+        with self.lock:
+            tstamp, result = self.results.get(key, (0, None))
+            now = time.time()
+            if now - tstamp > self.max_age and key not in self.pending:
+                self.pending.add(key)
+                self.queue.put_nowait((now, key))
+        return result
+
+    def _refresh_results(self):
+        while True:
+            queued_tstamp, key = self.queue.get()
+            if time.time() - queued_tstamp > self.max_age:
+                # Nobody has asked for this answer recently; the next get() queues
+                # it again, so a backlog cannot make all answers arbitrarily old
+                with self.lock:
+                    self.pending.discard(key)
+                continue
+
+            model_name, ip = key
+            try:
+                ret = self.session.get(
+                    self.url + "/is_limit_reached",
+                    params={"model": model_name, "user_id": ip},
+                    timeout=1,
+                )
+                result = ret.json()
+            except Exception as e:
+                logger.info("monitor error: %s", e)
+                result = None
+
+            now = time.time()
+            with self.lock:
+                self.results[key] = (now, result)
+                self.pending.discard(key)
+                if len(self.results) > self.max_entries:
+                    self.results = {
+                        k: v
+                        for k, v in self.results.items()
+                        if now - v[0] <= self.max_age
+                    }
+
+
+_rate_limit_cache = None
+_rate_limit_cache_lock = threading.Lock()
 
 
 def is_limit_reached(model_name, ip):
-    monitor_url = "http://localhost:9090"
+    global _rate_limit_cache
+    if _rate_limit_cache is None:
+        with _rate_limit_cache_lock:
+            if _rate_limit_cache is None:
+                _rate_limit_cache = RateLimitCache("http://localhost:9090")
+    return _rate_limit_cache.get(model_name, ip)
+
+
+def throttle_updates(updates, interval=STREAM_YIELD_INTERVAL):
+    """Yield from `updates`, dropping items that are superseded within `interval` seconds.
+
+    `updates` is drained on a helper thread, so an item that was held back is sent as
+    soon as the interval has passed, even if the stream then pauses. Items that queue
+    up while the caller is busy are collapsed to the newest one. The last item, and
+    the one held back when `updates` raises, are always sent.
+    """
+    if interval <= 0:
+        yield from updates
+        return
+
+    items = queue.Queue()
+    done = object()
+    stop = threading.Event()
+
+    def pump():
+        try:
+            for update in updates:
+                if stop.is_set():
+                    break
+                items.put((None, update))
+        except Exception as e:
+            items.put((e, None))
+        finally:
+            items.put((None, done))
+
+    threading.Thread(target=pump, daemon=True).start()
+    pending = None
+    last_yield_time = 0.0
     try:
-        ret = requests.get(
-            f"{monitor_url}/is_limit_reached?model={model_name}&user_id={ip}", timeout=1
-        )
-        obj = ret.json()
-        return obj
-    except Exception as e:
-        logger.info(f"monitor error: {e}")
-        return None
+        while True:
+            timeout = None
+            if pending is not None:
+                timeout = max(0.0, last_yield_time + interval - time.time())
+            try:
+                error, update = items.get(timeout=timeout)
+            except queue.Empty:
+                # No newer update within the interval; send the held-back one
+                last_yield_time = time.time()
+                yield pending
+                pending = None
+                continue
+            # Keep only the newest of the updates queued so far
+            while error is None and update is not done:
+                pending = update
+                try:
+                    error, update = items.get_nowait()
+                except queue.Empty:
+                    break
+            else:
+                if pending is not None:
+                    yield pending
+                if error is not None:
+                    raise error
+                return
+            now = time.time()
+            if now - last_yield_time >= interval:
+                last_yield_time = now
+                update, pending = pending, None
+                yield update
+    finally:
+        stop.set()
 
 
 def bot_response(
@@ -432,7 +872,7 @@ def bot_response(
     use_recommended_config=False,
 ):
     ip = get_ip(request)
-    logger.info(f"bot_response. ip: {ip}")
+    logger.info("bot_response. ip: %s", ip)
     start_tstamp = time.time()
     temperature = float(temperature)
     top_p = float(top_p)
@@ -441,16 +881,16 @@ def bot_response(
     if state.skip_next:
         # This generate call is skipped due to invalid inputs
         state.skip_next = False
-        yield (state, state.to_gradio_chatbot()) + (no_change_btn,) * 5
+        yield (state, state.to_gradio_chatbot()) + no_change_btns
         return
 
     if apply_rate_limit:
         ret = is_limit_reached(state.model_name, ip)
         if ret is not None and ret["is_limit_reached"]:
             error_msg = RATE_LIMIT_MSG + "\n\n" + ret["reason"]
-            logger.info(f"rate limit reached. ip: {ip}. error_msg: {ret['reason']}")
+            logger.info("rate limit reached. ip: %s. error_msg: %s", ip, ret["reason"])
             state.conv.update_last_message(error_msg)
-            yield (state, state.to_gradio_chatbot()) + (no_change_btn,) * 5
+            yield (state, state.to_gradio_chatbot()) + no_change_btns
             return
 
     conv, model_name = state.conv, state.model_name
@@ -461,24 +901,13 @@ def bot_response(
 
     if model_api_dict is None:
         # Query worker address
-        ret = requests.post(
-            controller_url + "/get_worker_address", json={"model": model_name}
-        )
-        worker_addr = ret.json()["address"]
-        logger.info(f"model_name: {model_name}, worker_addr: {worker_addr}")
+        worker_addr = get_worker_address(model_name)
+        logger.info("model_name: %s, worker_addr: %s", model_name, worker_addr)
 
         # No available worker
         if worker_addr == "":
             conv.update_last_message(SERVER_ERROR_MSG)
-            yield (
-                state,
-                state.to_gradio_chatbot(),
-                disable_btn,
-                disable_btn,
-                disable_btn,
-                enable_btn,
-                enable_btn,
-            )
+            yield (state, state.to_gradio_chatbot()) + error_btns
             return
 
         # Construct prompt.
@@ -530,7 +959,7 @@ def bot_response(
 
     # conv.update_last_message("▌")
     conv.update_last_message(html_code)
-    yield (state, state.to_gradio_chatbot()) + (disable_btn,) * 5
+    yield (state, state.to_gradio_chatbot()) + disable_btns
 
     try:
         data = {"text": ""}
@@ -551,50 +980,36 @@ def bot_response(
                 output = data["text"].strip()
                 conv.update_last_message(output + "▌")
                 # conv.update_last_message(output + html_code)
-                yield (state, state.to_gradio_chatbot()) + (disable_btn,) * 5
+                yield (state, state.to_gradio_chatbot()) + disable_btns
             else:
                 output = f"{SERVER_ERROR_MSG}\n\n" + data["text"] + f"\n\n(error_code: {data['error_code']})"
                 conv.update_last_message(output)
-                yield (state, state.to_gradio_chatbot()) + (
-                    disable_btn,
-                    disable_btn,
-                    disable_btn,
-                    enable_btn,
-                    enable_btn,
-                )
+                yield (state, state.to_gradio_chatbot()) + error_btns
                 return
         output = data["text"].strip()
         conv.update_last_message(output)
-        yield (state, state.to_gradio_chatbot()) + (enable_btn,) * 5
+        yield (state, state.to_gradio_chatbot()) + enable_btns
     except requests.exceptions.RequestException as e:
+        if model_api_dict is None:
+            # The worker may be gone; ask the controller again on the next turn
+            with worker_addr_cache_lock:
+                worker_addr_cache.pop(model_name, None)
         conv.update_last_message(
             f"{SERVER_ERROR_MSG}\n\n"
             f"(error_code: {ErrorCode.GRADIO_REQUEST_ERROR}, {e})"
         )
-        yield (state, state.to_gradio_chatbot()) + (
-            disable_btn,
-            disable_btn,
-            disable_btn,
-            enable_btn,
-            enable_btn,
-        )
+        yield (state, state.to_gradio_chatbot()) + error_btns
         return
     except Exception as e:
         conv.update_last_message(
             f"{SERVER_ERROR_MSG}\n\n"
             f"(error_code: {ErrorCode.GRADIO_STREAM_UNKNOWN_ERROR}, {e})"
         )
-        yield (state, state.to_gradio_chatbot()) + (
-            disable_btn,
-            disable_btn,
-            disable_btn,
-            enable_btn,
-            enable_btn,
-        )
+        yield (state, state.to_gradio_chatbot()) + error_btns
         return
 
     finish_tstamp = time.time()
-    logger.info(f"{output}")
+    logger.info("%s", output)
 
     conv.save_new_images(
         has_csam_images=state.has_csam_image, use_remote_storage=use_remote_storage
@@ -604,686 +1019,157 @@ def bot_response(
         is_vision=state.is_vision, has_csam_image=state.has_csam_image
     )
 
-    with open(filename, "a") as fout:
-        data = {
-            "tstamp": round(finish_tstamp, 4),
-            "type": "chat",
-            "model": model_name,
-            "gen_params": {
-                "temperature": temperature,
-                "top_p": top_p,
-                "max_new_tokens": max_new_tokens,
-            },
-            "start": round(start_tstamp, 4),
-            "finish": round(finish_tstamp, 4),
-            "state": state.dict(),
-            "ip": get_ip(request),
-        }
-        fout.write(json.dumps(data) + "\n")
-    get_remote_logger().log(data)
-
-
-block_css = """
-body:not(.dark) #filters_row #filter_checkbox {
-    background-color: white;
-}
-
-body.dark #filters_row #filter_checkbox {
-    background-color: #0f0f0f;
-}
-
-#filters_row .form {
-    border: none; 
-    box-shadow: none; 
-}
-
-#filters_row .block {
-    padding: 0; 
-}
-
-.wrap[data-testid="checkbox-group"] {
-    display: flex;
-}
-.wrap[data-testid="checkbox-group"] label {
-    border-top: 1px solid rgb(170, 170, 170);
-    border-right: 1px solid rgb(170, 170, 170);
-    border-bottom: 1px solid rgb(170, 170, 170);
-    border-left: 1px solid rgb(170, 170, 170);
-    flex: 1 1 230px;
-    max-width: 250px;
-}
-
-.wrap[data-testid="checkbox-group"] label span {
-    height: 23px;
-}
-
-body:not(.dark) .wrap[data-testid="checkbox-group"] label {
-    background: white;
-    color: var(--link-text-color);
-}
-
-body:not(.dark) .wrap[data-testid="checkbox-group"] label.selected {
-    background: white;
-    color: var(--link-text-color);
-}
-
-body:not(.dark) .wrap[data-testid="checkbox-group"] label:hover {
-    background: white;
-    color: var(--link-text-color);
-}
-
-body:not(.dark) .wrap[data-testid="checkbox-group"] input {
-    background-color: rgb(220, 220, 220);
-}
-
-
-body:not(.dark) .wrap[data-testid="checkbox-group"] input:hover {
-    background-color: rgb(220, 220, 220);
-}
-
-
-body .wrap[data-testid="checkbox-group"] input {
-    background: rgb(220, 220, 220); 
-}
-
-body .wrap[data-testid="checkbox-group"] input:hover {
-    background: rgb(220, 220, 220); 
-}
-
-body.dark .wrap[data-testid="checkbox-group"] label:hover {
-    background: #171717; 
-}
-
-body.dark .wrap[data-testid="checkbox-group"] label.selected {
-    background: #171717; 
-}
-
-body.dark .wrap[data-testid="checkbox-group"] label {
-    background: #171717; 
-}
-
-
-.prose {
-    font-size: 105% !important;
-}
-
-.tabs {
-    margin-bottom: 164px;
-    margin-top: -32px;
-}
-
-#input_row {
-    gap: 0;
-}
-
-body:not(.dark) #input_box, #input_row {
-    background-color: #ffffff70;
-}
-
-#input_box textarea {
-    font-size: 16px;
-}
-
-body:not(.dark) #input_box textarea::placeholder {
-    color: #444;
-}
-
-body:not(.dark) #input_box textarea:not([disabled]) {
-    background-color: white;
-}
-
-body.dark #input_box textarea::placeholder {
-    color: white;
-}
-
-body.dark #input_box textarea {
-    background-color: #444;
-    color: #ddd;
-}
-
-.chatbot {
-    box-shadow: none;
-}
-
-body:not(.dark) .chatbot_0 {
-    border-left: 1px solid #e5e5e5 !important;
-}
-
-body:not(.dark) .chatbot_1 {
-    border-right: 1px solid #e5e5e5 !important;
-}
-
-.voting_button {
-    border-top: 1px solid #AAA;
-    border-right: 1px solid #AAA;
-    border-bottom: 1px solid #AAA;
-}
-
-/*
-body:not(.dark) .voting_button {
-    background: white;
-    color: gray;
-}
-*/
-
-body.dark .voting-button {
-    border-top: 1px solid #666;
-    border-right: 1px solid #666;
-    border-bottom: 1px solid #666;
-}
-
-/*
-.voting_button:hover {
-    background: #DDD;
-}
-*/
-
-.voting_button:first-child {
-    border-left: 1px solid #AAA;
-    border-top-left-radius: 6px;
-}
-
-.voting_button:nth-child(2) {
-    border-right: 1px solid #AAA;
-    border-top-right-radius: 6px;
-}
-
-#selection_buttons_row {
-    gap: 0;
-}
-
-.hidden {
-    display: none;
-}
-
-.bold {
-    font-weight: 600;
-}
-
-body #hero_text {
-    background-color: #e0f0ff;
-    text-align: center;
-    padding: 32px 24px 56px;
-}
-
-body.dark #hero_text {
-    background-color: #394e61;
-}
-
-#hero_text h1 {
-    font-size: 34px;
-    padding-bottom: 24px;
-}
-
-#hero_text ol {
-    font-size: 18px;
-}
-
-#hero_text ol li {
-    padding: 2px 0;
-}
-
-#models_accordion {
-    border-bottom: none !important;
-    border-radius: 6px;
-}
-
-body:not(.dark) #models_accordion {
-    border: 1px solid #e5e5e5 !important;
-}
-
-.contributor_logos_top {
-    padding: 4px;
-    padding-left: 12px;
-    float: right;
-    display: inline-flex;
-}
-
-body.dark .contributor_logos_top,
-body.dark .contributor_logos_bottom {
-    padding-left: 12px;
-    background: #888;
-    border-radius: 6px;
-}
-
-.contributor_logos_bottom {
-    display: none;
-    padding: 8px 0;
-}
-
-.contributor_logo {
-    height: 28px;
-}
-
-.contributor_logos_top .contributor_logo {
-    height: 32px;
-}
-
-.contributor_logo:not(:first-child) {
-    margin-left: 12px;
-}
-
-#fixed_footer {
-    position: fixed;
-    bottom: 0px;
-    left: 0px;
-    width: calc(100% - 256px);
-    z-index: 25;
-    margin: 0 128px;
-    border-bottom-left-radius: 0;
-    border-bottom-right-radius: 0;
-}
-
-
-@media screen and (max-width: 1100px) {
-    #fixed_footer {
-        width: 100%;
-        margin: 0;
-    }
-}
-
-
-.voting_button {
-    min-width: 50%;
-    max-width: 50%;
-}
-
-button[disabled] {
-    opacity: 1;
-}
-
-@media screen and (min-width: 640px) {
-    .control_button:first-child {
-        margin-right: 12px;
-    }
-}
-
-body:not(.dark) #turnstile-container {
-    background: white;
-}
-body.dark #turnstile-container {
-    background: var(--background-fill-secondary);
-}
-
-@media screen and (max-width: 640px) {
-
-    #turnstile-container {
-        position: fixed;
-        bottom: 6px;
-        left: 4px;
-        z-index: 26;
-        background: unset;
-    }
-
-    .contributor_logos_top {
-        display: none;
-    }
-
-    .contributor_logos_bottom {
-        margin-top: 24px;
-        display: flex;
-        justify-content: space-around;
-    }
-
-    .chatbot {
-        height: 450px !important;
-    }
-
-
-    .message-row.bubble {
-        margin: var(--spacing-xl) var(--spacing-xl) var(--spacing-md) !important;
-    }
-
-    #fixed_footer {
-        width: 100%;
-        margin: 0;
-        border-radius: 0;
-    }
-    
-    #send_button {
-        min-width: unset;
-        padding: 0 16px;
-    }
-
-    #input_box textarea {
-        padding: 8px;
-        height: 56px !important;
-    }
-
-    #fixed_footer {
-        position: unset;
-    }
-
-    #input_row {
-        position: fixed;
-        bottom: 0;
-        left: 0;
-        width: 100%;
-        z-index: 25;
-    }
-
-    #chat_tab {
-        padding: 0;
-    }
-
-    #hero_container {
-        border-radius: 0;
-        margin-bottom: -32px;
-    }
-
-    #hero_text h2 {
-        font-size: 20px;
-    }
-
-    #hero_text h1 {
-        font-size: 30px;
-    }
-
-    #hero_text ol {
-        font-size: 16px;
-    }
-
-    #hero_text {
-        padding: 2px 24px 24px;
-    }
-
-    #selection_buttons_row {
-        position: fixed;
-        bottom: 84px;
-        left: 0;
-        width: 100%;
-        z-index: 25;
-    }
-
-    .voting_button {
-        min-width: 50%;
-        max-width: 50%;
-    }
-
-    .voting_button.secondary {
-        font-size: 15.5px;
-        min-height: 46px;
-    }
-
-    /*
-    .voting_button:nth-child(1) {
-        order: 1;
-    }
-    .voting_button:nth-child(2) {
-        order: 3;
-    }
-    .voting_button:nth-child(3) {
-        order: 4;
-    }
-    .voting_button:nth-child(4) {
-        order: 2;
-    }
-    */
-
-    .tabs {
-        margin-bottom: 172px;
+    finish = round(finish_tstamp, 4)
+    data = {
+        "tstamp": finish,
+        "type": "chat",
+        "model": model_name,
+        "gen_params": {
+            "temperature": temperature,
+            "top_p": top_p,
+            "max_new_tokens": max_new_tokens,
+        },
+        "start": round(start_tstamp, 4),
+        "finish": finish,
+        "state": state.dict(),
+        "ip": ip,
     }
-}
-
-
-
-#arena_leaderboard_dataframe table {
-    font-size: 105%;
-}
-#full_leaderboard_dataframe table {
-    font-size: 105%;
-}
-
-.tab-nav button {
-    font-size: 18px;
-}
-
-.chatbot h1 {
-    font-size: 130%;
-}
-.chatbot h2 {
-    font-size: 120%;
-}
-.chatbot h3 {
-    font-size: 110%;
-}
-
-#chatbot .prose {
-    font-size: 90% !important;
-}
-
-.sponsor-image-about img {
-    margin: 0 20px;
-    margin-top: 20px;
-    height: 40px;
-    max-height: 100%;
-    width: auto;
-    float: left;
-}
-
-.cursor {
-    display: inline-block;
-    width: 7px;
-    height: 1em;
-    background-color: black;
-    vertical-align: middle;
-    animation: blink 1s infinite;
-}
-
-.dark .cursor {
-    display: inline-block;
-    width: 7px;
-    height: 1em;
-    background-color: white;
-    vertical-align: middle;
-    animation: blink 1s infinite;
-}
-
-@keyframes blink {
-    0%, 50% { opacity: 1; }
-    50.1%, 100% { opacity: 0; }
-}
-
-.app {
-  max-width: 100% !important;
-  padding-left: 5% !important;
-  padding-right: 5% !important;
-}
-
-a {
-    color: #1976D2; /* Your current link color, a shade of blue */
-    text-decoration: none; /* Removes underline from links */
-}
-a:hover {
-    color: #63A4FF; /* This can be any color you choose for hover */
-    text-decoration: underline; /* Adds underline on hover */
-}
-
-.block {
-  overflow-y: hidden !important;
-}
+    get_conv_log_writer().write(filename, json.dumps(data) + "\n")
+    get_remote_logger().log(data)
 
-.visualizer {
-    overflow: hidden;
-    height: 60vw;
-    border: 1px solid lightgrey; 
-    border-radius: 10px;
-}
-
-@media screen and (max-width: 769px) {
-    .visualizer {
-        height: 180vw;
-        overflow-y: scroll;
-        width: 100%;
-        overflow-x: hidden;
-    }
-}
-"""
 
+def bot_response_throttled(
+    state: State,
+    temperature,
+    top_p,
+    max_new_tokens,
+    request: gr.Request,
+):
+    """bot_response with streamed chatbot updates sent at most every STREAM_YIELD_INTERVAL."""
+    yield from throttle_updates(
+        bot_response(state, temperature, top_p, max_new_tokens, request)
+    )
 
-# block_css = """
-# #notice_markdown .prose {
-#     font-size: 110% !important;
-# }
-# #notice_markdown th {
-#     display: none;
-# }
-# #notice_markdown td {
-#     padding-top: 6px;
-#     padding-bottom: 6px;
-# }
-# #arena_leaderboard_dataframe table {
-#     font-size: 110%;
-# }
-# #full_leaderboard_dataframe table {
-#     font-size: 110%;
-# }
-# #model_description_markdown {
-#     font-size: 110% !important;
-# }
-# #leaderboard_markdown .prose {
-#     font-size: 110% !important;
-# }
-# #leaderboard_markdown td {
-#     padding-top: 6px;
-#     padding-bottom: 6px;
-# }
-# #leaderboard_dataframe td {
-#     line-height: 0.1em;
-# }
-# #about_markdown .prose {
-#     font-size: 110% !important;
-# }
-# #ack_markdown .prose {
-#     font-size: 110% !important;
-# }
-# #chatbot .prose {
-#     font-size: 105% !important;
-# }
-# .sponsor-image-about img {
-#     margin: 0 20px;
-#     margin-top: 20px;
-#     height: 40px;
-#     max-height: 100%;
-#     width: auto;
-#     float: left;
-# }
 
-# body {
-#     --body-text-size: 14px;
-# }
+block_css = (static_dir / "block.css").read_text(encoding="utf-8")
 
-# .chatbot h1, h2, h3 {
-#     margin-top: 8px; /* Adjust the value as needed */
-#     margin-bottom: 0px; /* Adjust the value as needed */
-#     padding-bottom: 0px;
-# }
 
-# .chatbot h1 {
-#     font-size: 130%;
-# }
-# .chatbot h2 {
-#     font-size: 120%;
-# }
-# .chatbot h3 {
-#     font-size: 110%;
-# }
-# .chatbot p:not(:first-child) {
-#     margin-top: 8px;
-# }
+def get_model_description_md(models):
+    return _get_model_description_md(tuple(models))
 
-# .typing {
-#     display: inline-block;
-# }
 
-# """
+model_cell_fmt = "| [{simple_name}]({link}): {description} ".format
 
 
-def get_model_description_md(models):
-    model_description_md = """
-| | | |
-| ---- | ---- | ---- |
-"""
-    ct = 0
+def _get_model_description_infos(models):
+    unique_infos = []
     visited = set()
-    for i, name in enumerate(models):
+    for name in dict.fromkeys(models):
         minfo = get_model_info(name)
         if minfo.simple_name in visited:
             continue
         visited.add(minfo.simple_name)
-        one_model_md = f"[{minfo.simple_name}]({minfo.link}): {minfo.description}"
-
+        unique_infos.append(minfo)
+    return unique_infos
+
+
+@functools.lru_cache(maxsize=8)
+def _get_model_description_md(models):
+    parts = ["\n| | | |\n| ---- | ---- | ---- |\n"]
+    unique_infos = _get_model_description_infos(models)
+
+    # Three cells per row; each cell opens with "|" and a full row closes with "|\n"
+    for ct, minfo in enumerate(unique_infos, 1):
+        parts.append(
+            model_cell_fmt(
+                simple_name=minfo.simple_name,
+                link=minfo.link,
+                description=minfo.description,
+            )
+        )
         if ct % 3 == 0:
-            model_description_md += "|"
-        model_description_md += f" {one_model_md} |"
-        if ct % 3 == 2:
-            model_description_md += "\n"
-        ct += 1
-    return model_description_md
-
+            parts.append("|\n")
+    if len(unique_infos) % 3:
+        parts.append("|")
+    return "".join(parts)
 
-def build_terms():
-    gr.Markdown(acknowledgment_md, elem_id="terms_markdown")
 
+def get_model_description_html(models):
+    return _get_model_description_html(tuple(models))
 
-def build_about():
-    about_markdown = """
-## Meist
 
-**Tehisaru baromeeter** on Eesti teadlaste loodud platvorm, mille eesmärk on hinnata, kui hästi mõistavad ja kasutavad tänapäeva tehisarud eesti keelt. Veebilehel [baromeeter.ai](https://baromeeter.ai) saab võrrelda erinevate keelemudelite vastuseid ning aidata kaasa nende järjestamisele – ja seeläbi eesti keele ja meele hoidmisele tehisaru ajastul.
+md_link_pattern = re.compile(r"\[([^\]]+)\]\(([^)\s]+)\)")
+html_link_fmt = '<a href="{}" target="_blank" rel="noopener noreferrer">{}</a>'.format
 
-Platvormi arendavad koostöös Tartu Ülikool, Tallinna Tehnikaülikool, Tallinna Ülikool ja Eesti Keele Instituut. Tehisaru baromeeter tugineb avatud lähtekoodiga [ChatBotArena](https://lmarena.ai/) platvormile, mille töötasid välja California Ülikooli Berkeleys ja LMSYS teadlased. Algne platvorm on kohandatud emakeelseks, et paremini hinnata keelemudelite võimekust just eesti keeles.
 
-Tehisaru baromeetril on kolm funktsiooni:
+def _md_links_to_html(text):
+    # Descriptions may carry inline Markdown links; everything else is plain text
+    return md_link_pattern.sub(
+        lambda m: html_link_fmt(m.group(2), m.group(1)), html.escape(text)
+    )
 
-1. **Regulaarselt uuenev edetabel:** Kasutajate hinnangute põhjal kujuneb pidevalt uuenev järjestus, mis näitab, millised mudelid on eesti keeles kõige kvaliteetsemad. Edetabel peegeledab nii mudelite keeleoskust, faktiteadmisi, ohutust kui stiili ja iseloomu.
-2. **Andmete kogumine keelemudelite arendamiseks:** Iga antud hinnang ja küsimus aitab teadlastel koguda väärtuslikku sisendit, mida saab kasutada keelemudelite peenhäälestamiseks parema eesti keele toetuse eesmärgil.
-3. **TI-teadlikkuse tõstmine:** Baromeeter on hea võimalus katsetada erinevaid keelemudeleid, võrrelda vastuseid ning saada paremat aimu keelemudelite tugevustest ja nõrkustest just meie keelekeskkonnas.
 
-Kutsume kõiki huvilisi osalema! Projekti esialgne eesmärk on koguda kokku 50 000 võrdlust (praegust häälte arvu näed edetabeli vahelehel). Iga klikiga aitad parandada eesti keele nähtavust tehisaru maailmas.
+@functools.lru_cache(maxsize=8)
+def _get_model_description_html(models):
+    """The description table of _get_model_description_md, pre-rendered as HTML."""
+    unique_infos = _get_model_description_infos(models)
+    cells = [
+        "<td>"
+        + html_link_fmt(html.escape(minfo.link), html.escape(minfo.simple_name))
+        + ": "
+        + _md_links_to_html(minfo.description)
+        + "</td>"
+        for minfo in unique_infos
+    ]
+    rows = [
+        "<tr>" + "".join(cells[i : i + 3]) + "</tr>" for i in range(0, len(cells), 3)
+    ]
+    return "<table>" + "".join(rows) + "</table>"
 
-**Meeskond:**  
-- Kairit Sirts (projektijuht), Tartu Ülikool
-- Hele-Andra Kuulmets, Tartu Ülikool
-- Aleksei Dorkin, Tartu Ülikool
-- Krister Kruusmaa, Tallinna Ülikool
 
-**Meediakajastused:**
-- [https://cs.ut.ee/et/uudis/aita-valja-valida-koige-paremini-eesti-keelt-oskav-tehisaru](https://cs.ut.ee/et/uudis/aita-valja-valida-koige-paremini-eesti-keelt-oskav-tehisaru) *06.05.2025*
-- [https://digi.geenius.ee/blogi/keel-ja-tehnoloogia/krister-kruusmaa-tehisarust-eestlase-tegemisel-saab-igauks-oma-panuse-anda/](https://digi.geenius.ee/blogi/keel-ja-tehnoloogia/krister-kruusmaa-tehisarust-eestlase-tegemisel-saab-igauks-oma-panuse-anda/) *09.05.2025*
-- [https://novaator.err.ee/1609699473/keelemudelid-voivad-eesti-keeles-anda-toest-kaugele-jaavaid-vastuseid](https://novaator.err.ee/1609699473/keelemudelid-voivad-eesti-keeles-anda-toest-kaugele-jaavaid-vastuseid) *20.05.2025*
-- [https://jupiter.err.ee/1609688162/terevisioon?t=1315]([https://jupiter.err.ee/1609688162/terevisioon?t=1315]) *20.05.2025*
-- [https://r2.err.ee/1609701368/tlu-lektor-krister-kruusmaa-baromeeter-ai-annab-tehisintellektile-vajalikud-peenhaalestusandmed/er](https://r2.err.ee/1609701368/tlu-lektor-krister-kruusmaa-baromeeter-ai-annab-tehisintellektile-vajalikud-peenhaalestusandmed/er) *22.05.2025*
-- [https://kultuur.err.ee/1609717077/keeleminutid-mida-naitab-tehisaru-baromeeter](https://kultuur.err.ee/1609717077/keeleminutid-mida-naitab-tehisaru-baromeeter) *09.06.2025*
+def build_terms():
+    gr.Markdown(acknowledgment_md, elem_id="terms_markdown")
 
-**Kontakt:**  
-[baromeeter@tartunlp.ai](mailto:baromeeter@tartunlp.ai)
 
----
+about_md = (Path(__file__).parent / "about_et.md").read_text(encoding="utf-8")
 
-Tehisaru baromeeter on loodud teadusprojekti [„Eesti keele toetus suurtes generatiivsetes vabavaralistes keelemudelites”](https://www.etis.ee/Portal/Projects/Display/a420f147-a693-4e0e-ad9f-0570862d6a9f) raames. Projekti rahastatakse riiklikust programmist „Eesti keeletehnoloogia 2018–2027"
 
-"""
-    gr.Markdown(about_markdown, elem_id="about_markdown")
+def build_about():
+    gr.Markdown(about_md, elem_id="about_markdown")
 
 
-def build_single_model_ui(models, add_promotion_links=False):
-    promotion = (
-        f"""
+promotion_md = f"""
 [Blog](https://blog.lmarena.ai/blog/2023/arena/) | [GitHub](https://github.com/lm-sys/FastChat) | [Paper](https://arxiv.org/abs/2403.04132) | [Dataset](https://github.com/lm-sys/FastChat/blob/main/docs/dataset_release.md) | [Twitter](https://twitter.com/lmsysorg) | [Discord](https://discord.gg/6GXcFg3TH8) | [Kaggle Competition](https://www.kaggle.com/competitions/lmsys-chatbot-arena)
 
 {SURVEY_LINK}
 
 ## 👇 Choose any model to chat
 """
-        if add_promotion_links
-        else ""
-    )
 
-    notice_markdown = f"""
+notice_md_template = """
 # 🏔️ Chatbot Arena (formerly LMSYS): Free AI Chat to Compare & Test Best AI Chatbots
 {promotion}
 """
+# The notice shown above the single-model chat, with and without promotion links
+notice_md = {
+    True: notice_md_template.format(promotion=promotion_md),
+    False: notice_md_template.format(promotion=""),
+}
+
+
+latex_delimiters = [
+    {"left": "$", "right": "$", "display": False},
+    {"left": "$$", "right": "$$", "display": True},
+    {"left": r"\(", "right": r"\)", "display": False},
+    {"left": r"\[", "right": r"\]", "display": True},
+]
+
+
+def build_single_model_ui(models, add_promotion_links=False):
+    notice_markdown = notice_md[bool(add_promotion_links)]
+    n_models = len(models)
+    default_model = models[0] if n_models else ""
+    accordion_label = f"🔍 Expand to see the descriptions of {n_models} models"
 
     state = gr.State()
     gr.Markdown(notice_markdown, elem_id="notice_markdown")
@@ -1292,30 +1178,24 @@ def build_single_model_ui(models, add_promotion_links=False):
         with gr.Row(elem_id="model_selector_row"):
             model_selector = gr.Dropdown(
                 choices=models,
-                value=models[0] if len(models) > 0 else "",
+                value=default_model,
                 interactive=True,
                 show_label=False,
                 container=False,
             )
         with gr.Row():
-            with gr.Accordion(
-                f"🔍 Expand to see the descriptions of {len(models)} models",
-                open=False,
-            ):
-                model_description_md = get_model_description_md(models)
-                gr.Markdown(model_description_md, elem_id="model_description_markdown")
+            with gr.Accordion(accordion_label, open=False):
+                gr.HTML(
+                    get_model_description_html(models),
+                    elem_id="model_description_markdown",
+                )
 
         chatbot = gr.Chatbot(
             elem_id="chatbot",
             label="Scroll down and start chatting",
             height=650,
             show_copy_button=True,
-            latex_delimiters=[
-                {"left": "$", "right": "$", "display": False},
-                {"left": "$$", "right": "$$", "display": True},
-                {"left": r"\(", "right": r"\)", "display": False},
-                {"left": r"\[", "right": r"\]", "display": True},
-            ],
+            latex_delimiters=latex_delimiters,
         )
     with gr.Row():
         textbox = gr.Textbox(
@@ -1362,54 +1242,56 @@ def build_single_model_ui(models, add_promotion_links=False):
     #     gr.Markdown(acknowledgment_md, elem_id="ack_markdown")
 
     # Register listeners
-    btn_list = [upvote_btn, downvote_btn, flag_btn, regenerate_btn, clear_btn]
-    upvote_btn.click(
-        upvote_last_response,
-        [state, model_selector],
-        [textbox, upvote_btn, downvote_btn, flag_btn],
-    )
-    downvote_btn.click(
-        downvote_last_response,
-        [state, model_selector],
-        [textbox, upvote_btn, downvote_btn, flag_btn],
-    )
-    flag_btn.click(
-        flag_last_response,
-        [state, model_selector],
-        [textbox, upvote_btn, downvote_btn, flag_btn],
-    )
-    regenerate_btn.click(regenerate, state, [state, chatbot, textbox] + btn_list).then(
-        bot_response,
-        [state, temperature, top_p, max_output_tokens],
-        [state, chatbot] + btn_list,
-    )
-    clear_btn.click(clear_history, None, [state, chatbot, textbox] + btn_list)
-
-    model_selector.change(clear_history, None, [state, chatbot, textbox] + btn_list)
-
-    textbox.submit(
-        add_text,
-        [state, model_selector, textbox],
-        [state, chatbot, textbox] + btn_list,
-    ).then(
-        bot_response,
-        [state, temperature, top_p, max_output_tokens],
-        [state, chatbot] + btn_list,
+    btn_list = (upvote_btn, downvote_btn, flag_btn, regenerate_btn, clear_btn)
+    parameters = (temperature, top_p, max_output_tokens)
+    # Gradio expects lists for multi-component inputs and outputs
+    full_outputs = [state, chatbot, textbox, *btn_list]
+    bot_inputs = [state, *parameters]
+    bot_outputs = [state, chatbot, *btn_list]
+    vote_outputs = [textbox, *btn_list[:3]]
+    vote_fns = {
+        upvote_btn: upvote_last_response,
+        downvote_btn: downvote_last_response,
+        flag_btn: flag_last_response,
+    }
+
+    def vote(state, model_selector, evt: gr.EventData, request: gr.Request):
+        return vote_fns[evt.target](state, model_selector, request)
+
+    gr.on(
+        triggers=[btn.click for btn in vote_fns],
+        fn=vote,
+        inputs=[state, model_selector],
+        outputs=vote_outputs,
     )
-    send_btn.click(
-        add_text,
-        [state, model_selector, textbox],
-        [state, chatbot, textbox] + btn_list,
-    ).then(
-        bot_response,
-        [state, temperature, top_p, max_output_tokens],
-        [state, chatbot] + btn_list,
+    regenerate_btn.click(regenerate, state, full_outputs).then(
+        bot_response_throttled, bot_inputs, bot_outputs
     )
+    clear_btn.click(clear_history, None, full_outputs)
+
+    model_selector.change(clear_history, None, full_outputs)
+
+    gr.on(
+        triggers=[textbox.submit, send_btn.click],
+        fn=add_text,
+        inputs=[state, model_selector, textbox],
+        outputs=full_outputs,
+    ).then(bot_response_throttled, bot_inputs, bot_outputs)
 
     return [state, model_selector]
 
 
 def build_demo(models):
+    models = list(models)
+    model_list_mode = args.model_list_mode
+    if model_list_mode not in ["once", "reload"]:
+        raise ValueError(f"Unknown model list mode: {model_list_mode}")
+    load_js = (
+        get_window_url_params_with_tos_js
+        if args.show_terms_of_use
+        else get_window_url_params_js
+    )
+
     with gr.Blocks(
         title="Chatbot Arena (formerly LMSYS): Free AI Chat to Compare & Test Best AI Chatbots",
         theme=gr.themes.Default(),
@@ -1419,14 +1301,6 @@ def build_demo(models):
 
         state, model_selector = build_single_model_ui(models)
 
-        if args.model_list_mode not in ["once", "reload"]:
-            raise ValueError(f"Unknown model list mode: {args.model_list_mode}")
-
-        if args.show_terms_of_use:
-            load_js = get_window_url_params_with_tos_js
-        else:
-            load_js = get_window_url_params_js
-
         demo.load(
             load_demo,
             [url_params],
@@ -1436,6 +1310,7 @@ def build_demo(models):
             ],
             js=load_js,
         )
+        demo.unload(flush_conv_logs)
 
     return demo
 
@@ -1461,6 +1336,19 @@ if __name__ == "__main__":
         default=10,
         help="The concurrency count of the gradio queue",
     )
+    parser.add_argument(
+        "--max-threads",
+        type=int,
+        default=200,
+        help="The size of the gradio thread pool. Each streaming response holds one pool "
+        "thread. Single-model streams also run one reader thread outside the pool.",
+    )
+    parser.add_argument(
+        "--queue-max-size",
+        type=int,
+        default=64,
+        help="The maximum number of pending events in the gradio queue. Use 0 for no limit.",
+    )
     parser.add_argument(
         "--model-list-mode",
         type=str,
@@ -1514,16 +1402,20 @@ if __name__ == "__main__":
         auth = parse_gradio_auth_creds(args.gradio_auth_path)
 
     # Launch the demo
+    gr.set_static_paths(paths=[static_dir])
     demo = build_demo(models)
+    # Load model_adapter (torch, transformers) now rather than in the first chat
+    importlib.import_module("fastchat.model.model_adapter")
     demo.queue(
         default_concurrency_limit=args.concurrency_count,
-        status_update_rate=10,
+        status_update_rate="auto",
+        max_size=args.queue_max_size or None,
         api_open=False,
     ).launch(
         server_name=args.host,
         server_port=args.port,
         share=args.share,
-        max_threads=200,
+        max_threads=args.max_threads,
         auth=auth,
         root_path=args.gradio_root_path,
     )
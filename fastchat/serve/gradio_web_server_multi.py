@@ -37,6 +37,7 @@ from fastchat.serve.gradio_global_state import Context
 from fastchat.serve.gradio_web_server import (
     set_global_vars,
     block_css,
+    static_dir,
     build_single_model_ui,
     build_about,
     build_terms,
@@ -322,6 +323,12 @@ if __name__ == "__main__":
         default=10,
         help="The concurrency count of the gradio queue",
     )
+    parser.add_argument(
+        "--max-threads",
+        type=int,
+        default=200,
+        help="The size of the gradio thread pool. Each streaming response holds one thread.",
+    )
     parser.add_argument(
         "--model-list-mode",
         type=str,
@@ -435,6 +442,7 @@ if __name__ == "__main__":
         auth = parse_gradio_auth_creds(args.gradio_auth_path)
 
     # Launch the demo
+    gr.set_static_paths(paths=[static_dir])
     demo = build_demo(
         context,
         args.elo_results_file,
@@ -449,7 +457,7 @@ if __name__ == "__main__":
         server_name=args.host,
         server_port=args.port,
         share=args.share,
-        max_threads=200,
+        max_threads=args.max_threads,
         auth=auth,
         root_path=args.gradio_root_path,
         show_api=False,
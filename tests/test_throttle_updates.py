@@ -0,0 +1,63 @@
+"""
+Usage:
+python3 -m unittest tests.test_throttle_updates
+"""
+
+import time
+import unittest
+
+from fastchat.serve.gradio_web_server import throttle_updates
+
+
+def timed_stream(n, gap, pause=0.0):
+    for i in range(n):
+        yield i
+        time.sleep(gap)
+    if pause:
+        time.sleep(pause)
+        yield "final"
+
+
+class TestThrottleUpdates(unittest.TestCase):
+    def test_slow_consumer_gets_few_updates(self):
+        # 100 chunks 5 ms apart, sent to a consumer that needs 60 ms per update
+        received = []
+        for update in throttle_updates(timed_stream(100, 0.005), interval=0.05):
+            received.append(update)
+            time.sleep(0.06)
+        stream_end = time.time()
+
+        self.assertEqual(received[-1], 99)
+        self.assertLess(len(received), 20)
+        # The consumer only lags by the update it was busy with
+        self.assertLess(time.time() - stream_end, 0.5)
+
+    def test_held_back_update_is_sent_during_a_pause(self):
+        start = time.time()
+        received = []
+        for update in throttle_updates(timed_stream(5, 0.001, pause=1.0), 0.05):
+            received.append((update, time.time() - start))
+
+        self.assertEqual(received[-1][0], "final")
+        self.assertEqual(received[-2][0], 4)
+        self.assertLess(received[-2][1], 0.5)
+
+    def test_held_back_update_is_sent_before_an_error(self):
+        def failing_stream():
+            yield 1
+            yield 2
+            raise ValueError("stream failed")
+
+        received = []
+        with self.assertRaises(ValueError):
+            for update in throttle_updates(failing_stream(), interval=10):
+                received.append(update)
+
+        self.assertEqual(received[-1], 2)
+
+    def test_zero_interval_passes_every_update(self):
+        self.assertEqual(list(throttle_updates(iter([1, 2, 3]), 0)), [1, 2, 3])
+
+
+if __name__ == "__main__":
+    unittest.main()